@@ -8,9 +8,44 @@ based on market features captured during backtesting.
 
 Usage:
     python scripts/train_xgboost_model.py [CSV_FILE]
+    python scripts/train_xgboost_model.py [CSV_FILE] --partition-by asset,regimeEncoded
+    python scripts/train_xgboost_model.py --monitor 'analysis-output/ml_training_R_100_*.csv' [--retrain]
+
+    python scripts/train_xgboost_model.py --best-runs 30
 
 If no CSV file is provided, it will use the most recent one in analysis-output/
 
+Each run is recorded in the SQLite experiment store
+analysis-output/ml_experiments.sqlite (params, data hash, metrics, CV stats,
+stage timings, with per-feature importance and per-asset test metrics in
+child tables; --best-runs ranks each asset on its own test rows, so
+multi-asset runs count for every asset they cover). Pass
+--results-json to also write the old ml_results_<timestamp>.json.
+
+With --partition-by, one extra booster is trained per partition (e.g. per
+asset and regime) in a process pool, and a router that picks the partition
+model at scoring time (falling back to the global model) is saved to
+analysis-output/ml_partitions_<timestamp>/.
+
+Cores are detected from the CPU affinity mask and cgroup quota (--cores to
+override) and split between worker processes for CV folds / partitions and
+XGBoost threads inside each worker, with workers pinned to their cores.
+Per-stage core utilization is reported at the end of each run.
+
+The model is saved to ml_model_<timestamp>.json together with a probability
+calibrator (ml_calibrator_<timestamp>.json, --calibration isotonic|platt|none)
+fitted on out-of-fold predictions, since scale_pos_weight skews predict_proba.
+The calibrator is a lookup table applied with np.interp.
+
+Each training run also saves a compact drift snapshot of the feature
+distributions (ml_drift_snapshot_<timestamp>.json). --monitor streams new
+feature rows against it (per-file offsets and counts are kept in
+ml_drift_monitor_<timestamp>.json, so repeat runs only read rows
+added since the last run), reports PSI/KS drift per feature and, with
+--retrain, retrains on --retrain-csv or the newest labelled ml_training CSV
+newer than the snapshot (never its own training data) when enough features
+have drifted.
+
 Requirements:
     pip install pandas numpy xgboost scikit-learn matplotlib seaborn
 """
@@ -18,16 +53,27 @@ Requirements:
 import sys
 import os
 import glob
-from datetime import datetime
+import time
+import argparse
+import hashlib
+import multiprocessing
+import queue
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import json
 
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score, f1_score,
-    classification_report, confusion_matrix, roc_auc_score, roc_curve
+    classification_report, confusion_matrix, roc_auc_score, roc_curve, brier_score_loss
 )
+from sklearn.calibration import calibration_curve
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
 import xgboost as xgb
 
@@ -123,8 +169,39 @@ XGBOOST_PARAMS = {
     'reg_lambda': 1.0,
     'random_state': 42,
     'use_label_encoder': False,
+    'tree_method': 'hist',
+    # n_jobs is set per model by ResourceScheduler (all cores for the main
+    # model, each worker's core slice for CV folds and partitions)
 }
 
+# Partitioned training (--partition-by)
+# Columns that may be used as partition keys. 'asset' is an identifier column
+# in the ml_training CSV, the others are also model features.
+PARTITION_COLUMNS = ['asset', 'regimeEncoded', 'strategyEncoded']
+
+# Partitions smaller than this (or with a single class) are routed to the
+# global model instead of getting their own booster
+MIN_PARTITION_SAMPLES = 200
+
+# Probability calibration (--calibration)
+# scale_pos_weight skews predict_proba, so a calibrator fitted on out-of-fold
+# predictions maps it back to a real WIN probability
+CALIBRATION_GRID_POINTS = 101   # Lookup table size for Platt scaling
+CALIBRATION_BINS = 10           # Bins for reliability curves and ECE
+
+# Experiment store: one row per training run (replaces ml_results_*.json)
+EXPERIMENT_STORE = os.path.join('analysis-output', 'ml_experiments.sqlite')
+
+# Drift monitoring (--monitor)
+DRIFT_MAX_BINS = 32             # Max histogram bins per feature in the snapshot
+DRIFT_CHUNK_ROWS = 10000        # Rows per chunk when streaming monitored CSVs
+DRIFT_MIN_SAMPLES = 100         # Rows required before raising alerts
+DRIFT_PSI_ALERT = 0.25          # PSI > 0.25 = significant shift
+DRIFT_KS_ALERT = 0.2
+DRIFT_NULL_RATE_ALERT = 0.05    # Absolute change in null rate
+DRIFT_RETRAIN_MIN_FEATURES = 3  # Drifted features needed to trigger --retrain
+RETRAIN_MIN_SAMPLES = 200       # Min labelled rows in a CSV used for --retrain
+
 
 # =============================================================================
 # DATA LOADING
@@ -190,11 +267,173 @@ def prepare_features(df: pd.DataFrame) -> tuple:
     return X, y, available_features
 
 
+# =============================================================================
+# RESOURCE SCHEDULING
+# =============================================================================
+
+def _read_cpu_max(directory: str) -> float:
+    """cgroup v2 quota in cores from <directory>/cpu.max, or None."""
+    try:
+        with open(os.path.join(directory, 'cpu.max')) as f:
+            quota, period = f.read().split()
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_cfs_quota(directory: str) -> float:
+    """cgroup v1 quota in cores from <directory>/cpu.cfs_*, or None."""
+    try:
+        with open(os.path.join(directory, 'cpu.cfs_quota_us')) as f:
+            quota = int(f.read())
+        with open(os.path.join(directory, 'cpu.cfs_period_us')) as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _cgroup_cpu_quota() -> float:
+    """CPU quota (in cores) imposed on this process by cgroup v2 or v1, or None.
+
+    Reads the process's own cgroup from /proc/self/cgroup (e.g. a systemd
+    slice with CPUQuota) and walks up to the root, returning the smallest
+    limit found.
+    """
+    try:
+        with open('/proc/self/cgroup') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        lines = []
+
+    # (mount point, path of our cgroup, quota reader) per hierarchy
+    hierarchies = []
+    for line in lines:
+        hierarchy_id, controllers, path = line.split(':', 2)
+        if hierarchy_id == '0' and controllers == '':
+            hierarchies.append(('/sys/fs/cgroup', path, _read_cpu_max))
+        elif 'cpu' in controllers.split(','):
+            for mount in ('/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct'):
+                if os.path.isdir(mount):
+                    hierarchies.append((mount, path, _read_cfs_quota))
+                    break
+    if not hierarchies:
+        hierarchies = [('/sys/fs/cgroup', '/', _read_cpu_max), ('/sys/fs/cgroup/cpu', '/', _read_cfs_quota)]
+
+    limits = []
+    for mount, path, reader in hierarchies:
+        parts = [p for p in path.split('/') if p]
+        for depth in range(len(parts), -1, -1):
+            quota = reader(os.path.join(mount, *parts[:depth]))
+            if quota is not None:
+                limits.append(quota)
+
+    return min(limits) if limits else None
+
+
+def detect_available_cores() -> list:
+    """CPU ids this process may use, limited by affinity and cgroup quota."""
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_ids = sorted(os.sched_getaffinity(0))
+    else:
+        cpu_ids = list(range(os.cpu_count() or 1))
+
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpu_ids = cpu_ids[:max(1, int(quota))]
+    return cpu_ids
+
+
+# Threads for this pool worker, set by _init_worker from its core slice
+_worker_threads = None
+
+
+def _init_worker(core_slices):
+    """Pool initializer: pin this worker to its own slice of cores."""
+    global _worker_threads
+    try:
+        cores = core_slices.get_nowait()
+    except queue.Empty:
+        return
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    _worker_threads = len(cores)
+
+
+class ResourceScheduler:
+    """Splits the available cores between worker processes and XGBoost threads.
+
+    Each pool worker gets a disjoint slice of cores (pinned with
+    sched_setaffinity) and runs XGBoost with one thread per core in its
+    slice, so process and thread parallelism never oversubscribe the box.
+    """
+
+    def __init__(self, cores: int = None, max_workers: int = None, pin: bool = True):
+        if cores is not None and cores < 1:
+            raise ValueError(f"cores must be >= 1, got {cores}")
+        self.cpu_ids = detect_available_cores()
+        if cores and cores > len(self.cpu_ids):
+            print(f"   ⚠️  --cores {cores} exceeds the {len(self.cpu_ids)} available cores, "
+                  f"using {len(self.cpu_ids)}")
+        if cores:
+            self.cpu_ids = self.cpu_ids[:cores]
+        self.cores = len(self.cpu_ids)
+        self.max_workers = max_workers
+        self.pin = pin and hasattr(os, 'sched_setaffinity')
+        self.stages = {}
+
+    def plan(self, n_tasks: int) -> tuple:
+        """(workers, threads per worker) for n_tasks independent tasks.
+
+        threads is the minimum; with pinning the first cores % workers
+        workers get one extra core (and thread).
+        """
+        workers = max(1, min(n_tasks, self.cores, self.max_workers or self.cores))
+        return workers, max(1, self.cores // workers)
+
+    @contextmanager
+    def pool(self, n_tasks: int):
+        """Process pool sized for n_tasks, yielding (pool, threads per worker)."""
+        workers, threads = self.plan(n_tasks)
+        initializer, initargs = None, ()
+        if self.pin:
+            # Spread the remainder so no core is left idle
+            extra = self.cores % workers if self.cores >= workers else 0
+            core_slices = multiprocessing.Queue()
+            start = 0
+            for i in range(workers):
+                size = threads + (1 if i < extra else 0)
+                core_slices.put(self.cpu_ids[start:start + size])
+                start += size
+            initializer, initargs = _init_worker, (core_slices,)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+            yield executor, threads
+
+    def record(self, stage: str, wall: float, cpu: float):
+        """Record CPU seconds used vs. wall time x cores for a stage."""
+        self.stages[stage] = {
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'utilization': cpu / (wall * self.cores) if wall > 0 else 0.0,
+        }
+
+    def report(self) -> dict:
+        """Print and return per-stage core utilization."""
+        print(f"\n⚙️  Core Utilization ({self.cores} cores{', pinned' if self.pin else ''}):")
+        print("=" * 50)
+        for stage, r in self.stages.items():
+            bar = "█" * int(r['utilization'] * 30)
+            print(f"   {stage:18s} {r['wall_seconds']:7.2f}s  {r['utilization']*100:5.1f}% {bar}")
+
+        return {'cores': self.cores, 'cpu_ids': self.cpu_ids, 'pinned': self.pin, 'stages': self.stages}
+
+
 # =============================================================================
 # MODEL TRAINING
 # =============================================================================
 
-def train_model(X_train, y_train, X_test, y_test) -> xgb.XGBClassifier:
+def train_model(X_train, y_train, X_test, y_test, n_jobs: int = None) -> xgb.XGBClassifier:
     """Train XGBoost model with early stopping."""
     print("\n🚀 Training XGBoost model...")
 
@@ -208,6 +447,8 @@ def train_model(X_train, y_train, X_test, y_test) -> xgb.XGBClassifier:
     # Create model
     params = XGBOOST_PARAMS.copy()
     params['scale_pos_weight'] = scale_pos_weight
+    if n_jobs:
+        params['n_jobs'] = n_jobs
 
     model = xgb.XGBClassifier(**params)
 
@@ -222,14 +463,20 @@ def train_model(X_train, y_train, X_test, y_test) -> xgb.XGBClassifier:
     return model
 
 
-def evaluate_model(model, X_test, y_test, feature_names: list) -> dict:
-    """Evaluate model performance."""
+def evaluate_model(model, X_test, y_test, feature_names: list, calibrator: 'ProbabilityCalibrator' = None) -> dict:
+    """Evaluate model performance.
+
+    Threshold metrics cut at 0.5 on the calibrated probability when a
+    calibrator is given; ROC AUC is computed on the raw scores.
+    """
     print("\n📈 Model Evaluation:")
     print("=" * 50)
 
     # Predictions
-    y_pred = model.predict(X_test)
     y_pred_proba = model.predict_proba(X_test)[:, 1]
+    threshold_proba = calibrator.transform(y_pred_proba) if calibrator is not None else y_pred_proba
+    y_pred = (threshold_proba > 0.5).astype(int)
+    print(f"\n   Threshold: 0.5 on {'calibrated' if calibrator is not None else 'raw'} probability")
 
     # Metrics
     accuracy = accuracy_score(y_test, y_pred)
@@ -263,22 +510,78 @@ def evaluate_model(model, X_test, y_test, feature_names: list) -> dict:
         'f1': f1,
         'roc_auc': roc_auc,
         'confusion_matrix': cm.tolist(),
+        'threshold_on': 'calibrated' if calibrator is not None else 'raw',
     }
 
 
-def cross_validate(model, X, y, cv=5) -> dict:
-    """Perform stratified k-fold cross-validation."""
-    print(f"\n🔄 Cross-Validation ({cv}-fold):")
-    print("=" * 50)
+def _fit_fold(params: dict, X: pd.DataFrame, y: pd.Series, train_idx, test_idx) -> dict:
+    """Fit one CV fold and predict its held-out rows (runs inside a worker process)."""
+    start = time.process_time()
+    params = dict(params, n_jobs=_worker_threads or params.get('n_jobs'))
+    model = xgb.XGBClassifier(**params)
+    model.fit(X.iloc[train_idx], y.iloc[train_idx], verbose=False)
+    return {
+        'test_idx': test_idx,
+        'proba': model.predict_proba(X.iloc[test_idx])[:, 1],
+        'cpu': time.process_time() - start,
+    }
+
+
+def out_of_fold_proba(model, X, y, scheduler: ResourceScheduler, cv=5, stage: str = 'cv_folds') -> tuple:
+    """Out-of-fold WIN probabilities, training the folds in parallel.
 
+    Returns (oof_proba, folds) where folds is the list of test indices.
+    """
     skf = StratifiedKFold(n_splits=cv, shuffle=True, random_state=42)
+    splits = list(skf.split(X, y))
+    oof_proba = np.empty(len(y))
+    cpu = 0.0
+
+    start = time.perf_counter()
+    with scheduler.pool(len(splits)) as (pool, threads):
+        params = model.get_params()
+        params['n_jobs'] = threads
+        futures = [pool.submit(_fit_fold, params, X, y, train_idx, test_idx) for train_idx, test_idx in splits]
+        for future in as_completed(futures):
+            result = future.result()
+            oof_proba[result['test_idx']] = result['proba']
+            cpu += result['cpu']
+    scheduler.record(stage, time.perf_counter() - start, cpu)
+
+    return oof_proba, [test_idx for _, test_idx in splits]
+
+
+def cross_validate(model, X, y, scheduler: ResourceScheduler, cv=5, calibration: str = None) -> dict:
+    """Perform stratified k-fold cross-validation.
+
+    With a calibration method, each fold's predictions are calibrated by a
+    calibrator fitted on the other folds' out-of-fold predictions before
+    the 0.5 threshold metrics, matching evaluate_model.
+    """
+    print(f"\n🔄 Cross-Validation ({cv}-fold):")
+    print("=" * 50)
 
-    # Multiple metrics
-    scoring = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
+    # One fit per fold, all metrics scored from the same held-out predictions
+    oof_proba, folds = out_of_fold_proba(model, X, y, scheduler, cv=cv)
+    threshold_proba = oof_proba.copy()
+    if calibration:
+        for idx in folds:
+            other = np.setdiff1d(np.arange(len(y)), idx)
+            fold_calibrator = ProbabilityCalibrator.fit(oof_proba[other], y.values[other], calibration)
+            threshold_proba[idx] = fold_calibrator.transform(oof_proba[idx])
+
+    scorers = {
+        'accuracy': lambda y_true, p: accuracy_score(y_true, p > 0.5),
+        'precision': lambda y_true, p: precision_score(y_true, p > 0.5, zero_division=0),
+        'recall': lambda y_true, p: recall_score(y_true, p > 0.5, zero_division=0),
+        'f1': lambda y_true, p: f1_score(y_true, p > 0.5, zero_division=0),
+        'roc_auc': roc_auc_score,
+    }
     results = {}
 
-    for metric in scoring:
-        scores = cross_val_score(model, X, y, cv=skf, scoring=metric)
+    for metric, scorer in scorers.items():
+        proba = oof_proba if metric == 'roc_auc' else threshold_proba
+        scores = np.array([scorer(y.iloc[idx], proba[idx]) for idx in folds])
         results[metric] = {
             'mean': scores.mean(),
             'std': scores.std(),
@@ -289,6 +592,322 @@ def cross_validate(model, X, y, cv=5) -> dict:
     return results
 
 
+# =============================================================================
+# PROBABILITY CALIBRATION
+# =============================================================================
+
+class ProbabilityCalibrator:
+    """Monotone map from raw predict_proba to calibrated WIN probability.
+
+    Stored as a lookup table and applied with np.interp, so scoring a batch
+    costs one vectorized interpolation.
+    """
+
+    def __init__(self, method: str, xs, ys):
+        self.method = method
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+
+    @classmethod
+    def fit(cls, proba: np.ndarray, y: np.ndarray, method: str = 'isotonic') -> 'ProbabilityCalibrator':
+        """Fit on out-of-fold probabilities."""
+        if method == 'isotonic':
+            iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(proba, y)
+            return cls(method, iso.X_thresholds_, iso.y_thresholds_)
+
+        if method == 'platt':
+            logit = np.log(np.clip(proba, 1e-6, 1 - 1e-6) / (1 - np.clip(proba, 1e-6, 1 - 1e-6)))
+            lr = LogisticRegression().fit(logit.reshape(-1, 1), y)
+            xs = np.linspace(0, 1, CALIBRATION_GRID_POINTS)
+            grid_logit = np.log(np.clip(xs, 1e-6, 1 - 1e-6) / (1 - np.clip(xs, 1e-6, 1 - 1e-6)))
+            return cls(method, xs, lr.predict_proba(grid_logit.reshape(-1, 1))[:, 1])
+
+        raise ValueError(f"Unknown calibration method: {method}")
+
+    def transform(self, proba: np.ndarray) -> np.ndarray:
+        """Calibrate a batch of raw probabilities."""
+        return np.interp(proba, self.xs, self.ys)
+
+    def to_dict(self) -> dict:
+        return {'method': self.method, 'xs': self.xs.tolist(), 'ys': self.ys.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ProbabilityCalibrator':
+        return cls(data['method'], data['xs'], data['ys'])
+
+
+def expected_calibration_error(y_true, proba: np.ndarray, n_bins: int = CALIBRATION_BINS) -> float:
+    """ECE over equal-width probability bins."""
+    y_true = np.asarray(y_true)
+    bins = np.minimum((proba * n_bins).astype(int), n_bins - 1)
+    ece = 0.0
+    for b in np.unique(bins):
+        mask = bins == b
+        ece += abs(proba[mask].mean() - y_true[mask].mean()) * mask.sum() / len(proba)
+    return float(ece)
+
+
+def calibrate_model(
+    model, X_train, y_train, X_test, y_test, scheduler: ResourceScheduler,
+    method: str = 'isotonic', cv: int = 5
+) -> tuple:
+    """Fit a calibrator on out-of-fold predictions and report reliability on the test set."""
+    print(f"\n🎚️  Probability Calibration ({method}):")
+    print("=" * 50)
+
+    oof_proba, _ = out_of_fold_proba(model, X_train, y_train, scheduler, cv=cv, stage='calibration_folds')
+    calibrator = ProbabilityCalibrator.fit(oof_proba, y_train.values, method)
+
+    raw_proba = model.predict_proba(X_test)[:, 1]
+    calibrated_proba = calibrator.transform(raw_proba)
+
+    results = {'method': method, 'table_size': len(calibrator.xs)}
+    for name, proba in [('raw', raw_proba), ('calibrated', calibrated_proba)]:
+        frac_pos, mean_pred = calibration_curve(y_test, proba, n_bins=CALIBRATION_BINS, strategy='uniform')
+        results[name] = {
+            'brier': brier_score_loss(y_test, proba),
+            'ece': expected_calibration_error(y_test, proba),
+            'reliability': {'mean_predicted': mean_pred.tolist(), 'fraction_positive': frac_pos.tolist()},
+        }
+        print(f"   {name:10s}: Brier {results[name]['brier']:.4f}, ECE {results[name]['ece']:.4f}")
+
+    return calibrator, results
+
+
+# =============================================================================
+# PARTITIONED TRAINING
+# =============================================================================
+
+def partition_keys(df: pd.DataFrame, partition_by: list) -> pd.Series:
+    """Build a partition key per row, e.g. 'asset=R_100|regimeEncoded=2'."""
+    parts = []
+    for col in partition_by:
+        values = df[col].map(
+            lambda v: str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+        )
+        parts.append(col + '=' + values)
+
+    keys = parts[0]
+    for part in parts[1:]:
+        keys = keys + '|' + part
+    return keys
+
+
+def _train_partition(
+    key: str, X: pd.DataFrame, y: pd.Series, n_jobs: int, calibration: str = None, cv: int = 5
+) -> dict:
+    """Train one partition booster (runs inside a worker process).
+
+    With a calibration method, also fits the partition's own calibrator on
+    out-of-fold predictions, since each partition has its own
+    scale_pos_weight. Partitions with too few minority samples for CV get
+    no calibrator and use the global one.
+    """
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    neg_count = (y == 0).sum()
+    pos_count = (y == 1).sum()
+
+    params = XGBOOST_PARAMS.copy()
+    params['scale_pos_weight'] = neg_count / pos_count if pos_count > 0 else 1.0
+    params['n_jobs'] = _worker_threads or n_jobs
+
+    model = xgb.XGBClassifier(**params)
+    model.fit(X, y, verbose=False)
+
+    calibrator = None
+    n_splits = min(cv, int(neg_count), int(pos_count))
+    if calibration and n_splits >= 2:
+        skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+        oof_proba = np.empty(len(y))
+        for train_idx, test_idx in skf.split(X, y):
+            fold_model = xgb.XGBClassifier(**params)
+            fold_model.fit(X.iloc[train_idx], y.iloc[train_idx], verbose=False)
+            oof_proba[test_idx] = fold_model.predict_proba(X.iloc[test_idx])[:, 1]
+        calibrator = ProbabilityCalibrator.fit(oof_proba, y.values, calibration)
+
+    return {
+        'key': key,
+        'model': model,
+        'calibrator': calibrator,
+        'samples': len(y),
+        'win_rate': y.mean() * 100,
+        'seconds': time.perf_counter() - start,
+        'cpu': time.process_time() - cpu_start,
+    }
+
+
+class PartitionRouter:
+    """Routes each row to its partition booster, or to the global model.
+
+    Probabilities are calibrated with the partition's own calibrator,
+    falling back to the global calibrator (raw if there is none). Null
+    features are filled with the training medians before routing, as in
+    prepare_features.
+    """
+
+    def __init__(
+        self, partition_by: list, feature_names: list, models: dict, global_model,
+        calibrators: dict = None, global_calibrator: ProbabilityCalibrator = None,
+        fill_values: dict = None
+    ):
+        self.partition_by = partition_by
+        self.feature_names = feature_names
+        self.models = models
+        self.global_model = global_model
+        self.calibrators = calibrators or {}
+        self.global_calibrator = global_calibrator
+        self.fill_values = fill_values or {}
+
+    def predict_proba(self, df: pd.DataFrame, keys: pd.Series = None) -> np.ndarray:
+        """Predict WIN probability for each row of df.
+
+        df must hold the feature columns, and the partition columns unless
+        precomputed keys are given.
+        """
+        if self.fill_values:
+            df = df.fillna({col: v for col, v in self.fill_values.items() if col in df.columns})
+        if keys is None:
+            keys = partition_keys(df, self.partition_by)
+        X = df[self.feature_names]
+        proba = np.empty(len(df))
+
+        for key, idx in keys.groupby(keys.values).indices.items():
+            if key in self.models:
+                model = self.models[key]
+                calibrator = self.calibrators.get(key, self.global_calibrator)
+            else:
+                model = self.global_model
+                calibrator = self.global_calibrator
+
+            proba[idx] = model.predict_proba(X.iloc[idx])[:, 1]
+            if calibrator is not None:
+                proba[idx] = calibrator.transform(proba[idx])
+
+        return proba
+
+    def save(self, directory: str):
+        """Save the global model, partition models and routing manifest."""
+        os.makedirs(directory, exist_ok=True)
+        self.global_model.save_model(os.path.join(directory, 'global.json'))
+
+        partitions = {}
+        for i, (key, model) in enumerate(sorted(self.models.items())):
+            filename = f'partition_{i:03d}.json'
+            model.save_model(os.path.join(directory, filename))
+            partitions[key] = filename
+
+        manifest = {
+            'partition_by': self.partition_by,
+            'feature_names': self.feature_names,
+            'global_model': 'global.json',
+            'partitions': partitions,
+            'global_calibrator': self.global_calibrator.to_dict() if self.global_calibrator else None,
+            'calibrators': {key: c.to_dict() for key, c in sorted(self.calibrators.items())},
+            'fill_values': self.fill_values,
+        }
+        with open(os.path.join(directory, 'router.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> 'PartitionRouter':
+        """Load a router saved with save()."""
+        with open(os.path.join(directory, 'router.json')) as f:
+            manifest = json.load(f)
+
+        def _load(filename):
+            model = xgb.XGBClassifier()
+            model.load_model(os.path.join(directory, filename))
+            return model
+
+        models = {key: _load(filename) for key, filename in manifest['partitions'].items()}
+        calibrators = {
+            key: ProbabilityCalibrator.from_dict(data)
+            for key, data in manifest.get('calibrators', {}).items()
+        }
+        global_calibrator = manifest.get('global_calibrator')
+        return cls(
+            manifest['partition_by'],
+            manifest['feature_names'],
+            models,
+            _load(manifest['global_model']),
+            calibrators,
+            ProbabilityCalibrator.from_dict(global_calibrator) if global_calibrator else None,
+            manifest.get('fill_values'),
+        )
+
+
+def train_partitioned_models(
+    keys: pd.Series,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    global_model,
+    partition_by: list,
+    scheduler: ResourceScheduler,
+    min_samples: int = MIN_PARTITION_SAMPLES,
+    global_calibrator: ProbabilityCalibrator = None,
+    fill_values: dict = None
+) -> tuple:
+    """Train one booster per partition concurrently in a process pool."""
+    print(f"\n🧩 Partitioned Training ({', '.join(partition_by)}):")
+    print("=" * 50)
+
+    eligible = []
+    fallback = {}
+    for key, group in y_train.groupby(keys.loc[y_train.index]):
+        if len(group) < min_samples or group.nunique() < 2:
+            fallback[key] = len(group)
+        else:
+            eligible.append(key)
+
+    for key, count in sorted(fallback.items()):
+        print(f"   ↪️  {key}: {count} samples -> global model")
+
+    models = {}
+    calibrators = {}
+    calibration = global_calibrator.method if global_calibrator else None
+    summary = {'partitions': {}, 'fallback': fallback}
+
+    if eligible:
+        workers, n_jobs = scheduler.plan(len(eligible))
+        print(f"   Training {len(eligible)} partitions on {workers} workers x {n_jobs} threads")
+
+        start = time.perf_counter()
+        train_keys = keys.loc[X_train.index]
+        with scheduler.pool(len(eligible)) as (pool, n_jobs):
+            futures = []
+            for key in eligible:
+                mask = train_keys == key
+                futures.append(pool.submit(
+                    _train_partition, key, X_train[mask], y_train[mask], n_jobs, calibration
+                ))
+
+            for future in as_completed(futures):
+                result = future.result()
+                models[result['key']] = result.pop('model')
+                calibrator = result.pop('calibrator')
+                if calibrator is not None:
+                    calibrators[result['key']] = calibrator
+                result['calibrated'] = calibrator is not None
+                summary['partitions'][result['key']] = result
+                print(f"   ✅ {result['key']}: {result['samples']} samples, "
+                      f"{result['win_rate']:.1f}% win rate ({result['seconds']:.2f}s)")
+
+        wall = time.perf_counter() - start
+        scheduler.record('partitions', wall, sum(p.pop('cpu') for p in summary['partitions'].values()))
+        total = sum(p['seconds'] for p in summary['partitions'].values())
+        slowest = max(p['seconds'] for p in summary['partitions'].values())
+        summary.update({'wall_seconds': wall, 'sum_seconds': total, 'slowest_seconds': slowest})
+        print(f"\n   Wall time: {wall:.2f}s (slowest partition {slowest:.2f}s, sum {total:.2f}s)")
+
+    router = PartitionRouter(
+        partition_by, list(X_train.columns), models, global_model, calibrators, global_calibrator,
+        fill_values
+    )
+    return router, summary
+
+
 # =============================================================================
 # FEATURE IMPORTANCE ANALYSIS
 # =============================================================================
@@ -608,7 +1227,8 @@ def plot_results(
     X_test,
     y_test,
     importance_df: pd.DataFrame,
-    output_dir: str = 'analysis-output'
+    output_dir: str = 'analysis-output',
+    calibrator: ProbabilityCalibrator = None
 ):
     """Generate visualization charts."""
     if not HAS_PLOTTING:
@@ -644,9 +1264,13 @@ def plot_results(
     ax2.legend()
     ax2.grid(True, alpha=0.3)
 
+    # Calibrated probabilities, so every panel uses the same real 0.5 boundary
+    if calibrator is not None:
+        y_pred_proba = calibrator.transform(y_pred_proba)
+
     # 3. Confusion Matrix
     ax3 = axes[1, 0]
-    y_pred = model.predict(X_test)
+    y_pred = (y_pred_proba > 0.5).astype(int)
     cm = confusion_matrix(y_test, y_pred)
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', ax=ax3,
                 xticklabels=['LOSS', 'WIN'], yticklabels=['LOSS', 'WIN'])
@@ -676,31 +1300,563 @@ def plot_results(
 
 
 # =============================================================================
-# MAIN
+# DRIFT MONITORING
 # =============================================================================
 
-def main():
-    print("=" * 60)
-    print("🤖 XGBoost Trade Prediction Model")
-    print("=" * 60)
+def _model_bin_edges(trees: pd.DataFrame, feature: str, quantiles: np.ndarray) -> np.ndarray:
+    """Bin edges for a feature: the model's split thresholds, else deciles."""
+    cuts = np.unique(trees.loc[trees['Feature'] == feature, 'Split'].dropna().values)
+
+    if len(cuts) == 0:
+        cuts = np.unique(quantiles[10:-1:10])
+    if len(cuts) > DRIFT_MAX_BINS - 1:
+        cuts = cuts[np.linspace(0, len(cuts) - 1, DRIFT_MAX_BINS - 1).round().astype(int)]
+    return cuts
+
+
+def build_feature_snapshot(df: pd.DataFrame, feature_names: list, model, data_file: str = None) -> dict:
+    """Summarize the training distribution of each feature for drift monitoring.
+
+    Per feature: 101-point quantile digest, histogram on the model's bin cuts
+    and null rate, all computed on the raw (unfilled) values.
+    """
+    snapshot = {
+        'samples': len(df),
+        'data_file': data_file,
+        'data_hash': file_sha256(data_file) if data_file else None,
+        'features': {},
+    }
+    trees = model.get_booster().trees_to_dataframe()
+
+    for feature in feature_names:
+        raw = df[feature]
+        values = raw.dropna().values.astype(float)
+        quantiles = np.quantile(values, np.linspace(0, 1, 101)) if len(values) else np.zeros(101)
+        edges = _model_bin_edges(trees, feature, quantiles)
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+        snapshot['features'][feature] = {
+            'quantiles': [float(f'{q:.6g}') for q in quantiles],
+            'edges': edges.tolist(),
+            'counts': counts.tolist(),
+            'null_rate': float(raw.isnull().mean()),
+        }
+
+    return snapshot
+
+
+def find_latest_snapshot(directory: str = 'analysis-output') -> str:
+    """Find the most recent drift snapshot file."""
+    files = glob.glob(os.path.join(directory, 'ml_drift_snapshot_*.json'))
 
-    # Get CSV file
-    if len(sys.argv) > 1:
-        csv_file = sys.argv[1]
+    if not files:
+        raise FileNotFoundError(f"No drift snapshots found in {directory}")
+
+    return max(files, key=os.path.getmtime)
+
+
+def _digest_cdf(quantiles) -> tuple:
+    """Reference CDF at the distinct points of a quantile digest.
+
+    For repeated quantiles (discrete features) the CDF at that value is the
+    highest quantile level it holds.
+    """
+    quantiles = np.asarray(quantiles, dtype=float)
+    levels = np.linspace(0, 1, len(quantiles))
+    points = np.unique(quantiles)
+    return points, levels[np.searchsorted(quantiles, points, side='right') - 1]
+
+
+class DriftMonitor:
+    """Streaming PSI/KS drift against a training snapshot in O(bins) memory.
+
+    PSI uses the histogram on the model's split thresholds. KS compares the
+    live CDF with the training quantile digest at its (up to 101) points.
+    """
+
+    def __init__(self, snapshot: dict):
+        self.snapshot = snapshot
+        self.samples = 0
+        self.counts = {f: np.zeros(len(s['counts']), dtype=np.int64) for f, s in snapshot['features'].items()}
+        self.nulls = {f: 0 for f in snapshot['features']}
+        self._edges = {f: np.asarray(s['edges']) for f, s in snapshot['features'].items()}
+        self._digest = {f: _digest_cdf(s['quantiles']) for f, s in snapshot['features'].items()}
+        # Live counts at or below each digest point (last slot: above the max)
+        self.digest_counts = {f: np.zeros(len(p) + 1, dtype=np.int64) for f, (p, _) in self._digest.items()}
+        # Rows already consumed per file, so repeat runs only read new rows
+        self.offsets = {}
+
+    def state(self) -> dict:
+        """Accumulated counts and file offsets, for resuming on the next run."""
+        return {
+            'samples': self.samples,
+            'offsets': self.offsets,
+            'counts': {f: c.tolist() for f, c in self.counts.items()},
+            'digest_counts': {f: c.tolist() for f, c in self.digest_counts.items()},
+            'nulls': self.nulls,
+        }
+
+    def load_state(self, state: dict):
+        """Resume from a state() saved by a previous run."""
+        self.samples = state['samples']
+        self.offsets = state['offsets']
+        for feature, counts in state['counts'].items():
+            if feature in self.counts:
+                self.counts[feature] = np.asarray(counts, dtype=np.int64)
+        for feature, counts in state.get('digest_counts', {}).items():
+            if feature in self.digest_counts:
+                self.digest_counts[feature] = np.asarray(counts, dtype=np.int64)
+        self.nulls.update({f: n for f, n in state['nulls'].items() if f in self.nulls})
+
+    def update_from_csv(self, filepath: str) -> int:
+        """Stream the rows of filepath not seen yet, returning how many were read."""
+        key = os.path.abspath(filepath)
+        offset = self.offsets.get(key, 0)
+        columns = set(self._edges)
+        new_rows = 0
+
+        for chunk in pd.read_csv(
+            filepath,
+            chunksize=DRIFT_CHUNK_ROWS,
+            usecols=lambda c: c in columns,
+            skiprows=lambda i: 0 < i <= offset,
+        ):
+            self.update(chunk)
+            new_rows += len(chunk)
+
+        self.offsets[key] = offset + new_rows
+        return new_rows
+
+    def update(self, chunk: pd.DataFrame):
+        """Accumulate bin counts for a chunk of feature rows."""
+        self.samples += len(chunk)
+        for feature, edges in self._edges.items():
+            if feature not in chunk.columns:
+                self.nulls[feature] += len(chunk)
+                continue
+            raw = chunk[feature]
+            values = raw.dropna().values.astype(float)
+            self.nulls[feature] += int(raw.isnull().sum())
+            self.counts[feature] += np.bincount(
+                np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1
+            )
+            points = self._digest[feature][0]
+            self.digest_counts[feature] += np.bincount(
+                np.searchsorted(points, values, side='left'), minlength=len(points) + 1
+            )
+
+    def report(self) -> dict:
+        """PSI, KS and null-rate drift per feature, with alert flags."""
+        report = {}
+        for feature, ref in self.snapshot['features'].items():
+            expected = np.asarray(ref['counts'], dtype=float)
+            actual = self.counts[feature].astype(float)
+
+            if actual.sum() == 0 or expected.sum() == 0:
+                psi = ks = 0.0
+            else:
+                e = np.clip(expected / expected.sum(), 1e-4, None)
+                a = np.clip(actual / actual.sum(), 1e-4, None)
+                psi = float(np.sum((a - e) * np.log(a / e)))
+                # KS against the training quantile digest
+                points, ref_cdf = self._digest[feature]
+                live = self.digest_counts[feature]
+                live_cdf = np.cumsum(live)[:len(points)] / live.sum()
+                ks = float(np.max(np.abs(live_cdf - ref_cdf)))
+
+            null_rate = self.nulls[feature] / self.samples if self.samples else 0.0
+            null_shift = abs(null_rate - ref['null_rate'])
+
+            report[feature] = {
+                'psi': psi,
+                'ks': ks,
+                'null_rate': null_rate,
+                'ref_null_rate': ref['null_rate'],
+                'alert': self.samples >= DRIFT_MIN_SAMPLES and (
+                    psi > DRIFT_PSI_ALERT or ks > DRIFT_KS_ALERT or null_shift > DRIFT_NULL_RATE_ALERT
+                ),
+            }
+
+        return report
+
+
+def find_retrain_csv(
+    snapshot_file: str, snapshot: dict, retrain_csv: str = None, directory: str = 'analysis-output'
+) -> str:
+    """Pick the data to retrain on: retrain_csv, else the newest usable ml_training CSV.
+
+    A usable file is newer than the snapshot and is not its training data
+    (same path or content hash), so retraining cannot rebuild the same
+    snapshot. It also has a 'target' column and at least
+    RETRAIN_MIN_SAMPLES rows, so unlabelled live feature files and tiny
+    runs are skipped.
+    """
+    training_file = snapshot.get('data_file')
+    snapshot_mtime = os.path.getmtime(snapshot_file)
+
+    if retrain_csv:
+        candidates = [retrain_csv]
     else:
-        try:
-            csv_file = find_latest_csv()
-        except FileNotFoundError as e:
-            print(f"\n❌ Error: {e}")
-            print("Run backtest with ML collection first:")
-            print("  ASSET='R_100' DAYS='90' npx tsx src/scripts/backtest-hybrid-ml-collect.ts")
-            sys.exit(1)
+        candidates = sorted(glob.glob(os.path.join(directory, 'ml_training_*.csv')),
+                            key=os.path.getmtime, reverse=True)
+
+    for filepath in candidates:
+        if not os.path.exists(filepath):
+            print(f"   ⚠️  {filepath} not found")
+            continue
+        if training_file and os.path.abspath(filepath) == os.path.abspath(training_file):
+            print(f"   ⚠️  {filepath} is the snapshot's training data, skipping")
+            continue
+        if os.path.getmtime(filepath) <= snapshot_mtime:
+            print(f"   ⚠️  {filepath} is older than the snapshot, skipping")
+            continue
+        if snapshot.get('data_hash') and file_sha256(filepath) == snapshot['data_hash']:
+            print(f"   ⚠️  {filepath} has the same content as the snapshot's training data, skipping")
+            continue
+        if 'target' not in pd.read_csv(filepath, nrows=0).columns:
+            print(f"   ⚠️  {filepath} has no 'target' column, skipping")
+            continue
+        with open(filepath) as f:
+            rows = sum(1 for _ in f) - 1
+        if rows < RETRAIN_MIN_SAMPLES:
+            print(f"   ⚠️  {filepath} has only {rows} rows, skipping")
+            continue
+        return filepath
+
+    return None
+
+
+def run_monitor(args):
+    """Stream CSV feature rows through a DriftMonitor and report drift."""
+    print("\n📡 Drift Monitor:")
+    print("=" * 50)
+
+    try:
+        snapshot_file = args.snapshot or find_latest_snapshot()
+    except FileNotFoundError as e:
+        print(f"\n❌ Error: {e}")
+        print("Train a model first to create a drift snapshot.")
+        sys.exit(1)
+
+    with open(snapshot_file) as f:
+        snapshot = json.load(f)
+    print(f"   Snapshot: {snapshot_file} ({snapshot['samples']} training samples)")
+
+    # The snapshot's own training data is not evidence of drift
+    training_file = snapshot.get('data_file')
+    files = sorted(
+        {f for pattern in args.monitor for f in glob.glob(pattern)
+         if not training_file or os.path.abspath(f) != os.path.abspath(training_file)},
+        key=os.path.getmtime
+    )
+    if not files:
+        print(f"\n❌ Error: no files match {args.monitor} (excluding training data {training_file})")
+        sys.exit(1)
+
+    monitor = DriftMonitor(snapshot)
+    state_file = os.path.join(
+        os.path.dirname(snapshot_file),
+        os.path.basename(snapshot_file).replace('ml_drift_snapshot_', 'ml_drift_monitor_', 1)
+    )
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            monitor.load_state(json.load(f))
+        print(f"   Resuming from {state_file} ({monitor.samples} rows already seen)")
+
+    for filepath in files:
+        new_rows = monitor.update_from_csv(filepath)
+        print(f"   Streamed {filepath} (+{new_rows} new rows, {monitor.samples} total)")
+
+    with open(state_file, 'w') as f:
+        json.dump(monitor.state(), f)
+
+    report = monitor.report()
+    alerts = [f for f, r in report.items() if r['alert']]
+
+    print(f"\n   {'Feature':20s} {'PSI':>7s} {'KS':>7s} {'Nulls':>7s}")
+    print("   " + "-" * 45)
+    for feature, r in sorted(report.items(), key=lambda item: -item[1]['psi']):
+        indicator = "🚨" if r['alert'] else "  "
+        print(f"   {feature:20s} {r['psi']:7.3f} {r['ks']:7.3f} {r['null_rate']*100:6.1f}% {indicator}")
+
+    if monitor.samples < DRIFT_MIN_SAMPLES:
+        print(f"\n   ⚠️  Only {monitor.samples} rows, need {DRIFT_MIN_SAMPLES} before alerting")
+    elif alerts:
+        print(f"\n   🚨 Drift detected in {len(alerts)} features: {alerts}")
+    else:
+        print("\n   ✅ No drift detected")
+
+    if args.retrain and len(alerts) >= DRIFT_RETRAIN_MIN_FEATURES:
+        retrain_file = find_retrain_csv(snapshot_file, snapshot, args.retrain_csv)
+        if retrain_file is None:
+            print(f"\n   ⚠️  Not retraining: no new labelled training CSV with at least "
+                  f"{RETRAIN_MIN_SAMPLES} rows since the snapshot")
+            print("   Pass one with --retrain-csv or collect more data with backtest-hybrid-ml-collect.ts")
+        else:
+            print(f"\n🔁 Retraining on {retrain_file}...")
+            run_training(retrain_file, args)
+
+    return report
+
+
+# =============================================================================
+# EXPERIMENT STORE
+# =============================================================================
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Record the wall time of a pipeline stage in timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+def file_sha256(filepath: str) -> str:
+    """Content hash of a data file, so runs on identical data can be matched."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExperimentStore:
+    """Append-only SQLite store with one row per training run.
+
+    Per-feature importance and correlation live in the run_features child
+    table, per-asset test metrics in run_assets (so a multi-asset run counts
+    for each of its assets; runs.asset is then 'MULTI'). Run-level metrics
+    used for ranking are real columns, everything else is compact JSON.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            data_file TEXT,
+            data_hash TEXT,
+            asset TEXT,
+            samples INTEGER,
+            n_features INTEGER,
+            roc_auc REAL,
+            accuracy REAL,
+            precision REAL,
+            recall REAL,
+            f1 REAL,
+            cv_roc_auc_mean REAL,
+            cv_roc_auc_std REAL,
+            params TEXT,
+            metrics TEXT,
+            cv_results TEXT,
+            timings TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_asset_created ON runs (asset, created_at);
+        CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at);
+        CREATE INDEX IF NOT EXISTS idx_runs_data_hash ON runs (data_hash);
+
+        CREATE TABLE IF NOT EXISTS run_features (
+            run_id INTEGER NOT NULL REFERENCES runs (id),
+            feature TEXT NOT NULL,
+            importance REAL,
+            rank INTEGER,
+            correlation REAL,
+            PRIMARY KEY (run_id, feature)
+        );
+        CREATE INDEX IF NOT EXISTS idx_run_features_feature ON run_features (feature);
+
+        CREATE TABLE IF NOT EXISTS run_assets (
+            run_id INTEGER NOT NULL REFERENCES runs (id),
+            asset TEXT NOT NULL,
+            samples INTEGER,
+            roc_auc REAL,
+            accuracy REAL,
+            PRIMARY KEY (run_id, asset)
+        );
+        CREATE INDEX IF NOT EXISTS idx_run_assets_asset ON run_assets (asset, roc_auc);
+    """
+
+    def __init__(self, path: str = EXPERIMENT_STORE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+    def record_run(self, results: dict, importance_df: pd.DataFrame, corr_df: pd.DataFrame) -> int:
+        """Insert one run and its per-feature stats, returning the run id."""
+        def _json(obj):
+            return json.dumps(obj, separators=(',', ':'), default=str)
+
+        metrics = results['metrics']
+        cv_auc = results['cv_results'].get('roc_auc', {})
+        extra = {k: results[k] for k in ('timestamp', 'model_file', 'calibration', 'partitions', 'resources',
+                                         'drift_snapshot', 'insights', 'features_used')}
+
+        with self.conn:
+            cursor = self.conn.execute(
+                """INSERT INTO runs (created_at, data_file, data_hash, asset, samples, n_features,
+                       roc_auc, accuracy, precision, recall, f1, cv_roc_auc_mean, cv_roc_auc_std,
+                       params, metrics, cv_results, timings, extra)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    datetime.now().isoformat(timespec='seconds'),
+                    results['data_file'], results['data_hash'], results['asset'],
+                    results['samples'], len(results['features_used']),
+                    float(metrics['roc_auc']), float(metrics['accuracy']), float(metrics['precision']),
+                    float(metrics['recall']), float(metrics['f1']),
+                    float(cv_auc['mean']) if cv_auc else None,
+                    float(cv_auc['std']) if cv_auc else None,
+                    _json(results['params']), _json(metrics), _json(results['cv_results']),
+                    _json(results['timings']), _json(extra),
+                )
+            )
+            run_id = cursor.lastrowid
+
+            correlations = dict(zip(corr_df['feature'], corr_df['correlation']))
+            self.conn.executemany(
+                "INSERT INTO run_features (run_id, feature, importance, rank, correlation) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, row.feature, float(row.importance), int(row.rank),
+                     None if pd.isna(correlations.get(row.feature)) else float(correlations[row.feature]))
+                    for row in importance_df.itertuples()
+                ]
+            )
+
+            self.conn.executemany(
+                "INSERT INTO run_assets (run_id, asset, samples, roc_auc, accuracy) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, a['asset'], a['samples'], a['roc_auc'], a['accuracy'])
+                    for a in results.get('assets', [])
+                ]
+            )
+
+        return run_id
+
+    def best_runs_by_asset(self, days: int = 30, metric: str = 'roc_auc') -> list:
+        """Best run per asset over the last N days, scored on that asset's test rows."""
+        if metric not in ('roc_auc', 'accuracy'):
+            raise ValueError(f"Unknown metric: {metric}")
+
+        since = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        # SQLite returns the bare columns from the row holding the MAX()
+        rows = self.conn.execute(
+            f"""SELECT a.asset, r.id, r.created_at, r.data_file, MAX(a.{metric}) AS best
+                FROM run_assets a JOIN runs r ON r.id = a.run_id
+                WHERE r.created_at >= ? AND a.{metric} IS NOT NULL
+                GROUP BY a.asset ORDER BY best DESC""",
+            (since,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def per_asset_metrics(assets: pd.Series, model, X_test, y_test, calibrator: ProbabilityCalibrator = None) -> list:
+    """Test ROC AUC and accuracy for each asset in a (possibly multi-asset) run."""
+    raw_proba = model.predict_proba(X_test)[:, 1]
+    proba = calibrator.transform(raw_proba) if calibrator is not None else raw_proba
+    y_true = np.asarray(y_test)
+    assets = np.asarray(assets.astype(str))
+
+    results = []
+    for asset in np.unique(assets):
+        mask = assets == asset
+        results.append({
+            'asset': asset,
+            'samples': int(mask.sum()),
+            # AUC is undefined when the asset's test rows hold a single class
+            'roc_auc': float(roc_auc_score(y_true[mask], raw_proba[mask])) if len(np.unique(y_true[mask])) > 1 else None,
+            'accuracy': float(accuracy_score(y_true[mask], proba[mask] > 0.5)),
+        })
+    return results
+
+
+def print_best_runs(store_path: str, days: int):
+    """Print the best ROC AUC run per asset from the experiment store."""
+    print(f"\n🏆 Best ROC AUC per asset (last {days} days):")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    with ExperimentStore(store_path) as store:
+        rows = store.best_runs_by_asset(days)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if not rows:
+        print("   No runs recorded")
+    for row in rows:
+        print(f"   {str(row['asset']):12s} {row['best']:.4f}  run #{row['id']} ({row['created_at']}) {row['data_file']}")
+    print(f"\n   Query time: {elapsed_ms:.1f}ms")
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def _positive_int(value: str) -> int:
+    """argparse type for options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1, got {value}")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train XGBoost trade prediction model')
+    parser.add_argument('csv_file', nargs='?', help='ml_training CSV (default: most recent)')
+    parser.add_argument('--partition-by', default='',
+                        help=f"Comma-separated partition columns ({', '.join(PARTITION_COLUMNS)})")
+    parser.add_argument('--min-partition-samples', type=int, default=MIN_PARTITION_SAMPLES,
+                        help='Partitions with fewer training samples use the global model')
+    parser.add_argument('--workers', type=_positive_int, default=None,
+                        help='Max worker processes for CV folds and partitions (default: one per core)')
+    parser.add_argument('--cores', type=_positive_int, default=None,
+                        help='Cores to use (default: all available, cgroup-aware)')
+    parser.add_argument('--no-pin', action='store_true',
+                        help='Do not pin worker processes to cores')
+    parser.add_argument('--calibration', choices=['isotonic', 'platt', 'none'], default='isotonic',
+                        help='Probability calibration method (default: isotonic)')
+    parser.add_argument('--store', default=EXPERIMENT_STORE,
+                        help=f'Experiment store database (default: {EXPERIMENT_STORE})')
+    parser.add_argument('--results-json', action='store_true',
+                        help='Also write the full results to ml_results_<timestamp>.json')
+    parser.add_argument('--best-runs', type=int, metavar='DAYS',
+                        help='Print the best ROC AUC run per asset over the last DAYS and exit')
+    parser.add_argument('--monitor', nargs='+', metavar='CSV_GLOB',
+                        help='Monitor feature drift of these CSVs against a training snapshot')
+    parser.add_argument('--snapshot', default=None,
+                        help='Drift snapshot for --monitor (default: most recent)')
+    parser.add_argument('--retrain', action='store_true',
+                        help='With --monitor, retrain when drift is detected')
+    parser.add_argument('--retrain-csv', default=None,
+                        help='Labelled CSV for --retrain (default: newest usable ml_training CSV)')
+    return parser.parse_args()
+
+
+def run_training(csv_file: str, args):
+    """Train, evaluate and record results for one ml_training CSV."""
+    timings = {}
+    scheduler = ResourceScheduler(cores=args.cores, max_workers=args.workers, pin=not args.no_pin)
+    print(f"\n⚙️  Using {scheduler.cores} cores: {scheduler.cpu_ids}")
 
     # Load data
-    df = load_data(csv_file)
+    with timed(timings, 'load'):
+        df = load_data(csv_file)
+
+    partition_by = [c.strip() for c in args.partition_by.split(',') if c.strip()]
+    invalid = [c for c in partition_by if c not in PARTITION_COLUMNS or c not in df.columns]
+    if invalid:
+        print(f"\n❌ Error: invalid partition columns {invalid} (choose from {PARTITION_COLUMNS})")
+        sys.exit(1)
 
     # Prepare features
-    X, y, feature_names = prepare_features(df)
+    with timed(timings, 'prepare'):
+        X, y, feature_names = prepare_features(df)
 
     # Split data
     print(f"\n📦 Splitting data (80% train, 20% test)...")
@@ -711,46 +1867,170 @@ def main():
     print(f"   Test:  {len(X_test)} samples")
 
     # Train model
-    model = train_model(X_train, y_train, X_test, y_test)
+    with timed(timings, 'train'):
+        cpu_start = time.process_time()
+        model = train_model(X_train, y_train, X_test, y_test, n_jobs=scheduler.cores)
+    scheduler.record('train', timings['train'], time.process_time() - cpu_start)
 
-    # Evaluate
-    metrics = evaluate_model(model, X_test, y_test, feature_names)
+    output_dir = 'analysis-output'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    # Save model
+    model_file = os.path.join(output_dir, f'ml_model_{timestamp}.json')
+    model.save_model(model_file)
+    print(f"\n💾 Model saved to: {model_file}")
+
+    # Probability calibration
+    calibrator = None
+    calibration_results = None
+    if args.calibration != 'none':
+        with timed(timings, 'calibrate'):
+            calibrator, calibration_results = calibrate_model(
+                model, X_train, y_train, X_test, y_test, scheduler, method=args.calibration
+            )
+        calibrator_file = os.path.join(output_dir, f'ml_calibrator_{timestamp}.json')
+        with open(calibrator_file, 'w') as f:
+            json.dump(calibrator.to_dict(), f)
+        calibration_results['calibrator_file'] = calibrator_file
+        print(f"   Calibrator saved to: {calibrator_file}")
+
+    # Evaluate (0.5 threshold on the calibrated probability)
+    with timed(timings, 'evaluate'):
+        metrics = evaluate_model(model, X_test, y_test, feature_names, calibrator=calibrator)
 
     # Cross-validation
-    cv_results = cross_validate(model, X, y, cv=5)
+    with timed(timings, 'cross_validate'):
+        cv_results = cross_validate(
+            model, X, y, scheduler, cv=5, calibration=calibrator.method if calibrator else None
+        )
+
+    # Partitioned models
+    partition_results = None
+    if partition_by:
+        with timed(timings, 'partitions'):
+            # Feature columns come from the filled X so routing matches training
+            key_df = pd.DataFrame({
+                col: X[col] if col in X.columns else df.loc[X.index, col] for col in partition_by
+            })
+            keys = partition_keys(key_df, partition_by)
+            router, partition_results = train_partitioned_models(
+                keys, X_train, y_train, model, partition_by, scheduler,
+                min_samples=args.min_partition_samples, global_calibrator=calibrator,
+                fill_values={col: float(v) for col, v in X.median().dropna().items()}
+            )
+        routed_proba = router.predict_proba(X_test, keys.loc[X_test.index])
+        routed_auc = roc_auc_score(y_test, routed_proba)
+        partition_results['routed_roc_auc'] = routed_auc
+        partition_results['routed_brier'] = brier_score_loss(y_test, routed_proba)
+        partition_results['routed_ece'] = expected_calibration_error(y_test, routed_proba)
+        print(f"   Routed ROC AUC: {routed_auc:.4f} (global {metrics['roc_auc']:.4f}), "
+              f"ECE {partition_results['routed_ece']:.4f}")
+
+        router_dir = os.path.join(output_dir, f'ml_partitions_{timestamp}')
+        router.save(router_dir)
+        partition_results['router_dir'] = router_dir
+        print(f"   Router saved to: {router_dir}")
+
+    # Drift snapshot of the training distribution
+    with timed(timings, 'drift_snapshot'):
+        snapshot_file = os.path.join(output_dir, f'ml_drift_snapshot_{timestamp}.json')
+        with open(snapshot_file, 'w') as f:
+            json.dump(build_feature_snapshot(df, feature_names, model, data_file=csv_file), f)
+    print(f"\n📸 Drift snapshot saved to: {snapshot_file}")
 
     # Feature importance
-    importance_df = analyze_feature_importance(model, feature_names)
+    with timed(timings, 'importance'):
+        importance_df = analyze_feature_importance(model, feature_names)
 
     # Correlations
-    corr_df = analyze_feature_correlations(X, y)
+    with timed(timings, 'correlations'):
+        corr_df = analyze_feature_correlations(X, y)
 
     # Generate insights
-    insights = generate_insights(model, X, y, importance_df, corr_df, metrics)
+    with timed(timings, 'insights'):
+        insights = generate_insights(model, X, y, importance_df, corr_df, metrics)
 
     # Plot results
-    plot_results(model, X_test, y_test, importance_df)
+    with timed(timings, 'plot'):
+        plot_results(model, X_test, y_test, importance_df, calibrator=calibrator)
+
+    resources = scheduler.report()
+
+    # Per-asset test metrics, so multi-asset runs rank under each asset
+    asset_metrics = []
+    asset = None
+    if 'asset' in df.columns:
+        test_assets = df.loc[X_test.index, 'asset'].dropna()
+        asset_metrics = per_asset_metrics(
+            test_assets, model, X_test.loc[test_assets.index], y_test.loc[test_assets.index], calibrator
+        )
+        names = df['asset'].dropna().astype(str).unique()
+        asset = names[0] if len(names) == 1 else 'MULTI'
 
     # Save results
-    output_dir = 'analysis-output'
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-
     results = {
         'timestamp': timestamp,
         'data_file': csv_file,
+        'data_hash': file_sha256(csv_file),
+        'asset': asset,
+        'assets': asset_metrics,
         'samples': len(df),
         'features_used': feature_names,
+        'params': {
+            'xgboost': XGBOOST_PARAMS,
+            'scale_pos_weight': model.get_params()['scale_pos_weight'],
+            'calibration': args.calibration,
+            'partition_by': partition_by,
+        },
         'metrics': metrics,
         'cv_results': cv_results,
-        'feature_importance': importance_df.to_dict('records'),
-        'correlations': corr_df.to_dict('records'),
-        'insights': insights
+        'timings': timings,
+        'resources': resources,
+        'model_file': model_file,
+        'calibration': calibration_results,
+        'insights': insights,
+        'partitions': partition_results,
+        'drift_snapshot': snapshot_file,
     }
 
-    results_file = os.path.join(output_dir, f'ml_results_{timestamp}.json')
-    with open(results_file, 'w') as f:
-        json.dump(results, f, indent=2, default=str)
-    print(f"\n💾 Results saved to: {results_file}")
+    with ExperimentStore(args.store) as store:
+        run_id = store.record_run(results, importance_df, corr_df)
+    print(f"\n💾 Results recorded as run #{run_id} in: {args.store}")
+
+    if args.results_json:
+        results['feature_importance'] = importance_df.to_dict('records')
+        results['correlations'] = corr_df.to_dict('records')
+        results_file = os.path.join(output_dir, f'ml_results_{timestamp}.json')
+        with open(results_file, 'w') as f:
+            json.dump(results, f, separators=(',', ':'), default=str)
+        print(f"   Results JSON saved to: {results_file}")
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("🤖 XGBoost Trade Prediction Model")
+    print("=" * 60)
+
+    if args.best_runs is not None:
+        print_best_runs(args.store, args.best_runs)
+    elif args.monitor:
+        run_monitor(args)
+    else:
+        # Get CSV file
+        if args.csv_file:
+            csv_file = args.csv_file
+        else:
+            try:
+                csv_file = find_latest_csv()
+            except FileNotFoundError as e:
+                print(f"\n❌ Error: {e}")
+                print("Run backtest with ML collection first:")
+                print("  ASSET='R_100' DAYS='90' npx tsx src/scripts/backtest-hybrid-ml-collect.ts")
+                sys.exit(1)
+
+        run_training(csv_file, args)
 
     print("\n" + "=" * 60)
     print("✅ Analysis Complete!")